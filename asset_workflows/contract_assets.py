@@ -4,19 +4,23 @@ Script Name: contract_assets.py
 Summary:
     This script performs the following tasks:
       1. Fetches all associated assets for a specified contract from the
-         Freshservice API, handling pagination.
-      2. For each asset, it retrieves additional details by making API calls:
-         - Department Name from /api/v2/departments/[id]
-         - Location Name from /api/v2/locations/[id]
-         - Requester Name (combined first and last names) from /api/v2/requesters/[id]
-      3. Writes the retrieved asset information to a CSV file. The CSV is named 
+         Freshservice API, handling pagination (pages after the first are
+         requested several at a time).
+      2. Retrieves additional details for the assets with concurrent API calls
+         (at most 20 in flight):
+         - Department Names by listing /api/v2/departments
+         - Location Names by listing /api/v2/locations
+         - Requester Names (combined first and last names) from /api/v2/requesters,
+           filtering on up to 30 requester ids per query
+         Any id the bulk calls miss is looked up individually via
+         /api/v2/departments/[id], /api/v2/locations/[id] or /api/v2/requesters/[id].
+      3. Writes the retrieved asset information to an in-memory CSV. The CSV is named 
          using the format "YYYY-MM_Lease_1996594_Assets.csv" (where the date portion 
          is generated from the current date and the lease number is a constant).
       4. Updates a Freshservice ticket (supplied via a command-line argument)
-         by attaching the generated CSV file. The ticket update is done via a PUT 
+         by attaching the generated CSV. The ticket update is done via a PUT 
          request using a multipart/form-data payload, and it sets the ticket's priority 
-         to 1.
-      5. Upon successful ticket update (HTTP 200/201), deletes the CSV file from disk.
+         to 1. Nothing is written to disk.
       
 Usage:
     python contract_assets.py --ticket_id <ticket_id>
@@ -24,18 +28,21 @@ Usage:
     python contract_assets.py --ticket_id 54157
 
 Configuration:
-    - The Freshservice domain and API key are imported from the 'credentials' module.
+    - Freshservice access (domain, API key, pooling and retries) comes from the
+      shared fs_client.py at the repository root, which the script finds on its
+      own; it reads the 'credentials' module kept next to this script.
     - The contract_id is set to 37 by default (modify if needed).
     - The lease_number variable is set to "1996594" and is used in the CSV filename.
-    - The script requires the "requests" and "requests_toolbelt" modules.
+    - The script requires the "requests" and "requests_toolbelt" modules
+      (requests_toolbelt is used to stream attachments of 10 MB or more).
       Install the requests_toolbelt module via:
           pip install requests-toolbelt
 
 Dependencies:
-    - Python 3.x
+    - Python 3.9+
     - requests
     - requests_toolbelt
-    - Standard library modules: os, io, csv, argparse, base64, datetime
+    - Standard library modules: io, csv, sys, asyncio, argparse, datetime, pathlib
 
 Author: Sergio Gervacio
 Date: 2025-04-08
@@ -44,13 +51,17 @@ Date: 2025-04-08
 
 
 import requests
-import os
+import asyncio
 import io
 import csv
 import argparse
-import base64
-import credentials
 import datetime
+import sys
+from pathlib import Path
+# fs_client.py lives at the repository root, one level above this script.
+# Appended (not prepended) so credentials.py next to the script still wins.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from fs_client import fs_get, fs_put, fs_put_stream
 from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 # ---------------------------
@@ -64,162 +75,310 @@ ticket_id = args.ticket_id
 # ---------------------------
 # Configuration for Freshservice
 # ---------------------------
-FSURL = credentials.fs_domain
+# The shared fs_client session supplies the domain, auth, connection pooling
+# and retries; only the contract to export is configured here.
 contract_id = 37
-api_key = credentials.fs_api_key  # Your Freshservice API key
-
-# Ensure the base URL includes the scheme.
-if not FSURL.startswith("http"):
-    base_url = f"https://{FSURL}"
-else:
-    base_url = FSURL
-
-# Set default headers for JSON API calls
-json_headers = {
-    "Content-Type": "application/json"
-}
 
 # ---------------------------
 # Step 1: Fetch Assets and Generate CSV
 # ---------------------------
-all_assets = []
-page = 1
+# The API calls are I/O bound, so they are issued concurrently from an event
+# loop. Blocking session calls run in worker threads; the semaphore caps how
+# many are in flight at once (kept below the adapter's pool_maxsize).
+MAX_CONCURRENT_LOOKUPS = 20
+lookup_semaphore = None  # Created inside the running event loop in main().
+
+async def fetch(path):
+    """
+    GET a Freshservice API path through fs_get in a worker thread, with at most
+    MAX_CONCURRENT_LOOKUPS requests in flight.
+    """
+    async with lookup_semaphore:
+        return await asyncio.to_thread(fs_get, path)
+
 per_page = 100  # Adjust if necessary
+page_window = 5  # Number of pages requested speculatively at once
+
+async def fetch_page(page):
+    """
+    Fetch one page of associated assets.
+    Returns (assets, is_last_page).
+    """
+    asset_endpoint = f"contracts/{contract_id}/associated-assets?page={page}&per_page={per_page}"
+    response = await fetch(asset_endpoint)
+    # Rate limits and transient errors are already retried by the session, so
+    # anything left is a real failure; raise rather than export a partial list.
+    response.raise_for_status()
+    assets = response.json().get("associated_assets", [])
+    # Prefer the Link header when the API sends one; otherwise a short page
+    # means there is nothing after it.
+    if "link" in response.headers:
+        is_last_page = "next" not in response.links
+    else:
+        is_last_page = len(assets) < per_page
+    return assets, is_last_page
 
-while True:
-    asset_endpoint = f"{base_url}/api/v2/contracts/{contract_id}/associated-assets?page={page}&per_page={per_page}"
-    response = requests.get(asset_endpoint, auth=(api_key, "X"), headers=json_headers)
-    if response.status_code != 200:
-        print(f"Error retrieving assets on page {page}: {response.status_code} {response.text}")
-        break
-    data = response.json()
-    assets = data.get("associated_assets", [])
-    if not assets:
-        break
-    all_assets.extend(assets)
-    page += 1
+async def fetch_all_assets():
+    """
+    Fetch every associated asset for the contract.
+    The first page is fetched on its own (most contracts fit on one page);
+    after that, pages are requested in windows of page_window in parallel and
+    consumed in order until the last page is reached.
+    """
+    all_assets, is_last_page = await fetch_page(1)
+    page = 2
+    while not is_last_page:
+        results = await asyncio.gather(*(fetch_page(p) for p in range(page, page + page_window)))
+        for assets, is_last_page in results:
+            if assets:
+                all_assets.extend(assets)
+            if is_last_page or not assets:
+                is_last_page = True
+                break
+        page += page_window
+    return all_assets
 
 # Set up caching to avoid duplicate API calls for additional details.
+# Values are names, or an asyncio.Future while the lookup for that id is in flight.
 dept_cache = {}
 location_cache = {}
 requester_cache = {}
 
-def get_department_name(dept_id):
+async def single_flight(cache, key, lookup):
+    """
+    Return the cached value for key, running lookup() at most once per key.
+    While a lookup is in flight its Future is stored in the cache, so concurrent
+    callers for the same id await that result instead of issuing their own request.
+    If the lookup raises, the error propagates to the caller that started it,
+    the waiters get None, and the key is left uncached.
+    """
+    if key in cache:
+        value = cache[key]
+        if isinstance(value, asyncio.Future):
+            return await value
+        return value
+    future = asyncio.get_running_loop().create_future()
+    cache[key] = future
+    try:
+        value = await lookup()
+        future.set_result(value)
+        cache[key] = value
+        return value
+    finally:
+        if not future.done():
+            del cache[key]
+            future.set_result(None)
+
+# The lookups below only decode the JSON body on success; error logs show at
+# most the first 256 bytes of the raw body, since error pages can be large HTML.
+async def get_department_name(dept_id):
     if not dept_id:
         return None
-    if dept_id in dept_cache:
-        return dept_cache[dept_id]
-    dept_endpoint = f"{base_url}/api/v2/departments/{dept_id}"
-    r = requests.get(dept_endpoint, auth=(api_key, "X"), headers=json_headers)
-    if r.status_code == 200:
-        dept_name = r.json().get("department", {}).get("name")
-        dept_cache[dept_id] = dept_name
-        return dept_name
-    else:
-        print(f"Error retrieving department {dept_id}: {r.status_code} {r.text}")
-        return None
 
-def get_location_name(loc_id):
+    async def lookup():
+        dept_endpoint = f"departments/{dept_id}"
+        r = await fetch(dept_endpoint)
+        if r.ok:
+            return r.json().get("department", {}).get("name")
+        else:
+            print(f"Error retrieving department {dept_id}: {r.status_code} {r.content[:256]!r}")
+            return None
+
+    return await single_flight(dept_cache, dept_id, lookup)
+
+async def get_location_name(loc_id):
     if not loc_id:
         return None
-    if loc_id in location_cache:
-        return location_cache[loc_id]
-    loc_endpoint = f"{base_url}/api/v2/locations/{loc_id}"
-    r = requests.get(loc_endpoint, auth=(api_key, "X"), headers=json_headers)
-    if r.status_code == 200:
-        loc_name = r.json().get("location", {}).get("name")
-        location_cache[loc_id] = loc_name
-        return loc_name
-    else:
-        print(f"Error retrieving location {loc_id}: {r.status_code} {r.text}")
-        return None
 
-def get_requester_name(user_id):
+    async def lookup():
+        loc_endpoint = f"locations/{loc_id}"
+        r = await fetch(loc_endpoint)
+        if r.ok:
+            return r.json().get("location", {}).get("name")
+        else:
+            print(f"Error retrieving location {loc_id}: {r.status_code} {r.content[:256]!r}")
+            return None
+
+    return await single_flight(location_cache, loc_id, lookup)
+
+def format_requester_name(requester):
+    """Combine a requester's first and last names, or None if both are blank."""
+    first_name = requester.get("first_name", "").strip()
+    last_name = requester.get("last_name", "").strip()
+    return f"{first_name} {last_name}".strip() if first_name or last_name else None
+
+async def get_requester_name(user_id):
     if not user_id:
         return None
-    if user_id in requester_cache:
-        return requester_cache[user_id]
-    requester_endpoint = f"{base_url}/api/v2/requesters/{user_id}"
-    r = requests.get(requester_endpoint, auth=(api_key, "X"), headers=json_headers)
-    if r.status_code == 200:
-        requester = r.json().get("requester", {})
-        first_name = requester.get("first_name", "").strip()
-        last_name = requester.get("last_name", "").strip()
-        requester_name = f"{first_name} {last_name}".strip() if first_name or last_name else None
-        requester_cache[user_id] = requester_name
-        return requester_name
-    else:
-        print(f"Error retrieving requester {user_id}: {r.status_code} {r.text}")
-        return None
 
-# Create the CSV file with asset, department, location, and requester data.
+    async def lookup():
+        requester_endpoint = f"requesters/{user_id}"
+        r = await fetch(requester_endpoint)
+        if r.ok:
+            return format_requester_name(r.json().get("requester", {}))
+        else:
+            print(f"Error retrieving requester {user_id}: {r.status_code} {r.content[:256]!r}")
+            return None
+
+    return await single_flight(requester_cache, user_id, lookup)
+
+# ---------------------------
+# Bulk lookups
+# ---------------------------
+# Departments and locations are small tables, so listing them once is cheaper
+# than one GET per id. Requesters can be numerous, so only the ids actually
+# referenced by the assets are fetched, several per filter query.
+requester_batch_size = 30
+
+async def prefetch_names(resource, cache):
+    """Page through /api/v2/<resource> and cache every record's name by id."""
+    page = 1
+    while True:
+        list_endpoint = f"{resource}?page={page}&per_page={per_page}"
+        r = await fetch(list_endpoint)
+        if not r.ok:
+            print(f"Error listing {resource} on page {page}: {r.status_code} {r.content[:256]!r}")
+            return
+        records = r.json().get(resource, [])
+        for record in records:
+            cache[record["id"]] = record.get("name")
+        if len(records) < per_page:
+            return
+        page += 1
+
+async def prefetch_requester_batch(user_ids):
+    """Fetch the requesters for a batch of ids with a single filter query."""
+    query = " OR ".join(f"id:{user_id}" for user_id in user_ids)
+    encoded_query = requests.utils.quote(f'"{query}"')
+    requester_endpoint = f"requesters?query={encoded_query}&per_page={per_page}"
+    r = await fetch(requester_endpoint)
+    if not r.ok:
+        print(f"Error retrieving requesters {user_ids}: {r.status_code} {r.content[:256]!r}")
+        return
+    for requester in r.json().get("requesters", []):
+        requester_cache[requester["id"]] = format_requester_name(requester)
+
+async def prefetch_requester_names(user_ids):
+    """Fetch requester names in batches of requester_batch_size ids."""
+    user_ids = sorted(user_ids)
+    batches = [
+        user_ids[i:i + requester_batch_size]
+        for i in range(0, len(user_ids), requester_batch_size)
+    ]
+    # Wait for every batch, even if one fails, so the per-id fallback in main()
+    # only sees ids that no batch is still about to fill in.
+    report_errors(await asyncio.gather(
+        *(prefetch_requester_batch(batch) for batch in batches),
+        return_exceptions=True
+    ))
+
+def report_errors(results):
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error retrieving asset details: {result}")
+
+async def main():
+    """
+    Fetch all associated assets and fill the department, location and
+    requester caches for them, using bulk calls first and falling back to
+    per-id lookups for anything the bulk calls did not return.
+    """
+    global lookup_semaphore
+    lookup_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOOKUPS)
+    all_assets = await fetch_all_assets()
+
+    dept_ids = {a.get("department_id") for a in all_assets if a.get("department_id")}
+    loc_ids = {a.get("location_id") for a in all_assets if a.get("location_id")}
+    user_ids = {a.get("user_id") for a in all_assets if a.get("user_id")}
+
+    report_errors(await asyncio.gather(
+        prefetch_names("departments", dept_cache),
+        prefetch_names("locations", location_cache),
+        prefetch_requester_names(user_ids),
+        return_exceptions=True
+    ))
+
+    # Ids missing from the bulk results (e.g. a failed page, or a user that
+    # the requester filter did not match) are looked up one by one.
+    report_errors(await asyncio.gather(
+        *(get_department_name(dept_id) for dept_id in dept_ids - dept_cache.keys()),
+        *(get_location_name(loc_id) for loc_id in loc_ids - location_cache.keys()),
+        *(get_requester_name(user_id) for user_id in user_ids - requester_cache.keys()),
+        return_exceptions=True
+    ))
+    return all_assets
+
+all_assets = asyncio.run(main())
+
+# Build the CSV in memory with asset, department, location, and requester data.
+# It is only ever uploaded, so there is no need to round-trip it through disk.
 lease_number = "1996594"
 csv_filename = f"{datetime.datetime.now().strftime('%Y-%m')}_Lease_{lease_number}_Assets.csv"
-csv_file_path = csv_filename  # Use in place of "associated_assets.csv"
-with open(csv_file_path, "w", newline="") as csvfile:
-    writer = csv.writer(csvfile)
-    writer.writerow(["display_id", "asset_tag", "name", "department", "location", "requester"])
-    
-    for asset in all_assets:
-        display_id = asset.get("display_id")
-        asset_tag = asset.get("asset_tag")
-        asset_name = asset.get("name")
-        
-        dept_id = asset.get("department_id")
-        loc_id = asset.get("location_id")
-        user_id = asset.get("user_id")
-        
-        dept_name = get_department_name(dept_id) if dept_id else None
-        loc_name = get_location_name(loc_id) if loc_id else None
-        requester_name = get_requester_name(user_id) if user_id else None
-        
-        writer.writerow([display_id, asset_tag, asset_name, dept_name, loc_name, requester_name])
-
-print(f"CSV file created successfully: {csv_file_path}")
+csv_buffer = io.BytesIO()
+csv_text = io.TextIOWrapper(csv_buffer, encoding="utf-8", newline="", write_through=True)
+writer = csv.writer(csv_text)
+
+# All names were fetched up front, so each row is plain cache lookups; the
+# rows are then written in a single writerows() call.
+rows = [
+    (
+        asset.get("display_id"),
+        asset.get("asset_tag"),
+        asset.get("name"),
+        dept_cache.get(asset.get("department_id")),
+        location_cache.get(asset.get("location_id")),
+        requester_cache.get(asset.get("user_id"))
+    )
+    for asset in all_assets
+]
+writer.writerow(["display_id", "asset_tag", "name", "department", "location", "requester"])
+writer.writerows(rows)
+
+csv_text.flush()
+csv_text.detach()  # Release the wrapper without closing the underlying buffer.
+csv_buffer.seek(0)
+
+print(f"CSV generated in memory: {csv_filename}")
 
 # ---------------------------
 # Step 2: Update the Ticket with the CSV as an Attachment
 # ---------------------------
-def update_ticket_with_attachment(ticket_id, file_path):
+# Attachments at least this large are streamed with MultipartEncoder.
+streaming_upload_threshold = 10 * 1024 * 1024  # 10 MB
+
+def update_ticket_with_attachment(ticket_id, file_buffer, filename):
     """
-    Updates the specified ticket by attaching the CSV file.
-    This uses a PUT request to the ticket endpoint with a multipart/form-data payload.
-    After a successful update, the CSV file is deleted.
+    Updates the specified ticket by attaching the in-memory CSV buffer.
+    This uses a PUT request to the ticket endpoint with a multipart/form-data payload;
+    filename is only used for the attachment's name.
     """
-    ticket_endpoint = f"{base_url}/api/v2/tickets/{ticket_id}"
-    
-    # Read the entire file into memory and create a BytesIO stream.
-    try:
-        with open(file_path, "rb") as f:
-            file_data = f.read()
-        file_stream = io.BytesIO(file_data)
-    except Exception as e:
-        print(f"Error reading file {file_path}: {e}")
-        return
-
-    # Construct the fields for the multipart form-data.
-    fields = {
-        "priority": "1",  # field value as a string
-        "attachments[]": (
-            os.path.basename(file_path),
-            file_stream,
-            "application/octet-stream"
-        )
-    }
-    
-    # Use MultipartEncoder to build the body with proper boundaries.
-    m = MultipartEncoder(fields=fields)
-    
-    # Prepare the Authorization header (using the API key).
-    base64_auth = base64.b64encode(f"{api_key}:X".encode()).decode()
-    headers = {
-        "Authorization": f"Basic {base64_auth}",
-        "Content-Type": m.content_type  # includes the boundary
-    }
+    ticket_endpoint = f"tickets/{ticket_id}"
     
+    attachment = (filename, file_buffer, "text/csv")
     
     try:
-        response = requests.put(ticket_endpoint, data=m, headers=headers)
+        if len(file_buffer.getbuffer()) < streaming_upload_threshold:
+            # Small files: requests' native multipart encoding is much cheaper
+            # than MultipartEncoder. Clearing the session's JSON Content-Type
+            # lets requests set multipart/form-data with its own boundary.
+            response = fs_put(
+                ticket_endpoint,
+                data={"priority": "1"},  # field value as a string
+                files={"attachments[]": attachment},
+                headers={"Content-Type": None}
+            )
+        else:
+            # Large files: MultipartEncoder streams the body in chunks. It
+            # cannot be rewound, so it is sent once, without retries.
+            m = MultipartEncoder(fields={
+                "priority": "1",
+                "attachments[]": attachment
+            })
+            # Authorization comes from the session; only the multipart content type is set here.
+            headers = {
+                "Content-Type": m.content_type  # includes the boundary
+            }
+            response = fs_put_stream(ticket_endpoint, data=m, headers=headers)
     except Exception as e:
         print("Exception during PUT request:", e)
         return
@@ -229,15 +388,9 @@ def update_ticket_with_attachment(ticket_id, file_path):
     
     if response.status_code in (200, 201):
         print(f"Ticket {ticket_id} updated successfully with the CSV attachment.")
-        # Now that the file is no longer in use, delete it.
-        try:
-            os.remove(file_path)
-            print(f"CSV file '{file_path}' deleted successfully.")
-        except Exception as e:
-            print(f"Error deleting CSV file '{file_path}':", e)
     else:
-        print(f"Error updating ticket {ticket_id}: {response.status_code} {response.text}")
+        print(f"Error updating ticket {ticket_id}: {response.status_code} {response.content[:256]!r}")
 
 # IMPORTANT: Actually call the function to update the ticket.
 print("Calling update_ticket_with_attachment()...")
-update_ticket_with_attachment(ticket_id, csv_file_path)
+update_ticket_with_attachment(ticket_id, csv_buffer, csv_filename)
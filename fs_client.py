@@ -0,0 +1,116 @@
+"""
+----------------------------------------------------------------------
+Script Name: fs_client.py
+
+Summary:
+    Shared Freshservice API client for the scripts in this repository, so
+    they all reuse one preconfigured connection pool instead of each
+    building their own headers and sessions:
+      • session            A keep-alive requests.Session with a pooled
+                           HTTPAdapter, retries with back-off for 429/5xx
+                           responses (honouring Retry-After; POST only on
+                           429), Basic auth, and the JSON Content-Type.
+      • api_url(path)      Joins a path onto https://<fs_domain>/api/v2/.
+      • fs_get / fs_post / fs_put
+                           Call the session with api_url(path); keyword
+                           arguments are passed through to requests.
+      • fs_put_stream      PUT a streamed, non-rewindable body (e.g. a
+                           MultipartEncoder) without retries.
+
+Usage:
+    from fs_client import fs_get
+    response = fs_get(f"tickets/{ticket_id}")
+
+Configuration:
+    • `credentials.py` must define fs_domain and fs_api_key; fs_password is
+      optional and defaults to "X" (Freshservice ignores the password for
+      API-key auth).
+    • The scripts in the subfolders add the repository root to sys.path
+      before importing this module; credentials.py is still picked up from
+      the script's own folder.
+
+Dependencies:
+    • Python 3.9+
+    • requests (urllib3 is installed with it)
+----------------------------------------------------------------------
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import credentials
+
+# Accept the domain with or without a scheme.
+if credentials.fs_domain.startswith("http"):
+    base_url = credentials.fs_domain.rstrip("/")
+else:
+    base_url = f"https://{credentials.fs_domain}"
+
+# Freshservice ignores the password for API-key auth; "X" is the usual filler.
+fs_password = getattr(credentials, "fs_password", "X")
+
+class FreshserviceRetry(Retry):
+    """
+    Retry policy for Freshservice calls. GET and PUT are retried on 429 and
+    5xx responses as configured; POST (new notes, service requests) is not
+    idempotent, so it is only retried on 429, which Freshservice rejects
+    before doing any work.
+    """
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST":
+            return status_code == 429 and bool(self.total)
+        return super().is_retry(method, status_code, has_retry_after)
+
+# Shared keep-alive session so every Freshservice call reuses the same
+# connection pool instead of opening a new TCP/TLS connection each time.
+session = requests.Session()
+session.auth = (credentials.fs_api_key, fs_password)
+session.headers.update({
+    "Content-Type": "application/json",
+    "Connection": "keep-alive"
+})
+session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    # Ride out Freshservice rate limits (429, honouring Retry-After) and
+    # transient server errors instead of failing the whole run.
+    # Once retries run out, the last response is returned (raise_on_status=False)
+    # so callers' status checks and raise_for_status() still see it.
+    # PUT retries are only safe for bytes bodies, which urllib3 can re-send;
+    # streamed bodies must go through fs_put_stream instead.
+    max_retries=FreshserviceRetry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "PUT"],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+))
+
+# Streamed bodies cannot be rewound, so a retry would re-send the headers
+# with nothing left to read. They use a session that never retries.
+stream_session = requests.Session()
+stream_session.auth = session.auth
+stream_session.headers.update(session.headers)
+stream_session.mount("https://", HTTPAdapter(max_retries=0))
+
+def api_url(path):
+    """Return the full Freshservice API v2 URL for path, e.g. 'tickets/42'."""
+    return f"{base_url}/api/v2/{path.lstrip('/')}"
+
+def fs_get(path, **kwargs):
+    """GET a Freshservice API v2 path through the shared session."""
+    return session.get(api_url(path), **kwargs)
+
+def fs_post(path, **kwargs):
+    """POST to a Freshservice API v2 path through the shared session."""
+    return session.post(api_url(path), **kwargs)
+
+def fs_put(path, **kwargs):
+    """PUT to a Freshservice API v2 path through the shared session."""
+    return session.put(api_url(path), **kwargs)
+
+def fs_put_stream(path, **kwargs):
+    """PUT a streamed body to a Freshservice API v2 path without retries."""
+    return stream_session.put(api_url(path), **kwargs)
@@ -24,18 +24,22 @@ Usage:
     python freshservice_hrms_termination.py 54157
 
 Configuration:
+    • Freshservice calls go through the shared **fs_client.py** session
+      (pooling, retries, auth) at the repository root; the script adds that
+      folder to sys.path itself, so no PYTHONPATH setup is needed.
     • All secrets live in **credentials.py**:
         - fs_api_key, fs_password, fs_domain      # Freshservice
         - apiKey, username, password, company     # HRMS
     • Service Catalog item ID is hard‑coded as 95 (change if needed).
     • Falls back to “noreply@hrms.com” when the manager’s email is missing.
-    • A 5-second sleep after HRMS login mitigates occasional auth latency.
+    • The first HRMS report call is retried on 401/403 with short back-offs
+      (about 3.7s in total) to absorb occasional auth latency after login.
 
 Dependencies:
     • Python 3.9+
     • requests
-    • xmltodict
-    • Standard library: argparse, re, base64, json, time, datetime
+    • lxml
+    • Standard library: argparse, re, sys, json, time, datetime, pathlib
 
 Author: Sergio Gervacio
 Date: 2024-09-27
@@ -45,33 +49,30 @@ Date: 2024-09-27
 import argparse
 import requests
 import re
-import base64
 import json
 import time
-import xmltodict
+from lxml import etree
 from datetime import datetime
 import credentials
+import sys
+from pathlib import Path
+# fs_client.py lives at the repository root, one level above this script.
+# Appended (not prepended) so credentials.py next to the script still wins.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from fs_client import api_url, fs_get, fs_post
 
-def get_headers():
-    """Generate headers for the Freshservice API requests."""
-    api_credentials = f"{credentials.fs_api_key}:{credentials.fs_password}"
-    encoded_credentials = base64.b64encode(api_credentials.encode()).decode()
-    return {
-        'Content-Type': 'application/json',
-        'Authorization': f'Basic {encoded_credentials}'
-    }
+# Matches the "Employee ID: <number>" line in the ticket description.
+EMPLOYEE_ID_PATTERN = re.compile(r"Employee ID:\s*(\d+)")
 
-def fetch_ticket_data(ticket_id, headers):
+def fetch_ticket_data(ticket_id):
     """Fetch ticket data from Freshservice."""
-    ticket_api = credentials.fs_domain
-    url = f'https://{ticket_api}/api/v2/tickets/{ticket_id}'
-    response = requests.get(url, headers=headers)
+    response = fs_get(f'tickets/{ticket_id}')
     response.raise_for_status()
     return response.json()
 
 def extract_employee_id(description_text):
     """Extract employee ID from the ticket description."""
-    match = re.search(r"Employee ID:\s*(\d+)", description_text)
+    match = EMPLOYEE_ID_PATTERN.search(description_text)
     if match:
         return match.group(1)
     else:
@@ -123,34 +124,64 @@ def fetch_employee_data(employee_id, token):
             }
         ]
     }
-    response = requests.post(report_url, headers=headers, data=json.dumps(report_data))
-    response.raise_for_status()
-    response_dict = xmltodict.parse(response.content)
-    if 'result' not in response_dict:
+    response = requests.post(report_url, headers=headers, data=json.dumps(report_data), stream=True)
+
+    # Stream the report with lxml and stop at the first employee row instead
+    # of parsing every row. The report looks like
+    # <result><header><col><label>..</label></col>..</header><body><row><col>..</col>..</row>..</body></result>.
+    labels = None
+    values = None
+    try:
+        # Inside the try so a rejected (e.g. 401/403, retried by the caller)
+        # streamed response is still closed.
+        response.raise_for_status()
+        response.raw.decode_content = True
+        context = etree.iterparse(response.raw, events=("end",), tag=("header", "row"))
+        for _, elem in context:
+            if elem.tag == "header" and elem.getparent().tag == "result":
+                labels = [element_text(col.find("label")) for col in elem.iterfind("col")]
+            elif elem.tag == "row":
+                values = [element_text(col) for col in elem.iterfind("col")]
+                break  # Only the first row is used.
+            elem.clear()
+    finally:
+        response.close()
+
+    if labels is None:
         raise ValueError("No result found in the response")
-    return response_dict
+    if values is None:
+        raise ValueError("No employee row found in the response")
+    return {"labels": labels, "row": values}
+
+def element_text(elem):
+    """Return an element's stripped text, or None if it is missing or blank."""
+    if elem is None or elem.text is None:
+        return None
+    return elem.text.strip() or None
+
+def fetch_employee_data_with_retry(employee_id, token):
+    """
+    Fetch employee data from HRMS, allowing for a freshly issued token that
+    is not accepted yet. A 401/403 is retried with growing delays (about 3.7s
+    in total); any other error is raised immediately.
+    """
+    for delay in (0.2, 0.5, 1.0, 2.0):
+        try:
+            return fetch_employee_data(employee_id, token)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (401, 403):
+                raise
+            print(f"HRMS rejected the token ({e.response.status_code}), retrying in {delay}s...")
+            time.sleep(delay)
+    return fetch_employee_data(employee_id, token)
 
-def process_employee_data(response_dict):
+def process_employee_data(report):
     """Process employee data from HRMS response."""
     labels = [
-        col["label"].strip().replace('\n', ' ').replace('  ', ' ')
-        for col in response_dict["result"]["header"]["col"]
+        label.replace('\n', ' ').replace('  ', ' ')
+        for label in report["labels"]
     ]
-    rows = response_dict["result"]["body"]["row"]
-
-    # Ensure rows is always a list
-    if not isinstance(rows, list):
-        rows = [rows]
-
-    employee_data_list = []
-
-    for row in rows:
-        values = row["col"]
-        aligned_data = dict(zip(labels, values))
-        employee_data_list.append(aligned_data)
-
-    # Assuming you want to process the first employee
-    employee_data = employee_data_list[0]
+    employee_data = dict(zip(labels, report["row"]))
 
     # Date conversion
     for date_field in ["Effective Date", "Date Hired", "Date Started", "IT Deactivation Date"]:
@@ -164,17 +195,15 @@ def process_employee_data(response_dict):
 
 def fetch_requester_info(email):
     """Fetch requester or agent ID and manager ID from Freshservice."""
-    domain = credentials.fs_domain
-    headers = get_headers()
     email = email.lower()
     
     # Define a helper function to perform the API query
     def search_api(endpoint, field_name):
         query = f'"{field_name}:\'{email}\'"'
         encoded_query = requests.utils.quote(query)
-        url = f"https://{domain}/api/v2/{endpoint}?query={encoded_query}"
-        print(f"Request URL: {url}")
-        response = requests.get(url, headers=headers)
+        path = f"{endpoint}?query={encoded_query}"
+        print(f"Request URL: {api_url(path)}")
+        response = fs_get(path)
         response.raise_for_status()
         return response.json()
     
@@ -213,12 +242,8 @@ def fetch_requester_info(email):
 
 def fetch_manager_email(manager_id):
     """Fetch manager email from Freshservice."""
-    domain = credentials.fs_domain
-    headers = get_headers()
-    
     # Try fetching the manager as a requester first
-    url = f"https://{domain}/api/v2/requesters/{manager_id}"
-    response = requests.get(url, headers=headers)
+    response = fs_get(f"requesters/{manager_id}")
     if response.status_code == 200:
         response_json = response.json()
         manager_email = response_json["requester"]["primary_email"]
@@ -226,8 +251,7 @@ def fetch_manager_email(manager_id):
         return manager_email
     elif response.status_code == 404:
         # If not found as a requester, try as an agent
-        url = f"https://{domain}/api/v2/agents/{manager_id}"
-        response = requests.get(url, headers=headers)
+        response = fs_get(f"agents/{manager_id}")
         if response.status_code == 200:
             response_json = response.json()
             manager_email = response_json["agent"]["email"]
@@ -243,8 +267,7 @@ def fetch_manager_email(manager_id):
 
 def create_service_request(requester_id, it_deactivation_date, manager_email):
     """Create a service request in Freshservice."""
-    domain = credentials.fs_domain
-    ticket_url = f"https://{domain}/api/v2/service_catalog/items/95/place_request"
+    ticket_path = "service_catalog/items/95/place_request"
 
     # Default manager_email to 'noreply@hrms.com' if None
     if not manager_email:
@@ -259,17 +282,14 @@ def create_service_request(requester_id, it_deactivation_date, manager_email):
             "employee_change_type": "Termination"
         }
     }
-    headers = get_headers()
 
     # Log request details for debugging
-    print("Request URL:", ticket_url)
+    print("Request URL:", api_url(ticket_path))
     print("Request Data:", json.dumps(service_request_data, indent=4))
 
-    response = requests.post(
-        ticket_url,
-        headers=headers,
-        data=json.dumps(service_request_data),
-        auth=(credentials.fs_api_key, credentials.fs_password)
+    response = fs_post(
+        ticket_path,
+        data=json.dumps(service_request_data)
     )
     try:
         response.raise_for_status()
@@ -288,8 +308,7 @@ def main():
     parser.add_argument("ticket_id", type=int, help="The ID of the ticket to fetch")
     args = parser.parse_args()
 
-    headers = get_headers()
-    ticket_data = fetch_ticket_data(args.ticket_id, headers)
+    ticket_data = fetch_ticket_data(args.ticket_id)
     description_text = ticket_data['ticket']['description_text']
 
     try:
@@ -300,10 +319,11 @@ def main():
         return
 
     try:
-        token = login_HRMS()
-        time.sleep(5)  # Wait for 5-10 seconds as needed
-        response_dict = fetch_employee_data(employee_id, token)
-        employee_data = process_employee_data(response_dict)
+        token = login_hrms()
+        if not token:
+            raise ValueError("HRMS login did not return a token.")
+        report = fetch_employee_data_with_retry(employee_id, token)
+        employee_data = process_employee_data(report)
         print(json.dumps(employee_data, indent=4))
 
         op_primary_email = employee_data["Primary Email"]
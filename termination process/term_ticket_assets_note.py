@@ -8,7 +8,8 @@ Summary:
       2. Pulls the ticket’s **requested items** and extracts the employee
          reference stored in the custom field `untitled`.
       3. Queries the Freshservice Assets API for every asset assigned to that
-         employee and, for each, fetches its Asset‑Type metadata.
+         employee and fetches the Asset‑Type metadata once per distinct type,
+         in parallel.
       4. Builds an HTML bullet list of the assets and adds it as a **public
          note** to the ticket so requesters see what must be collected.
       5. Updates the ticket’s `assets` relationship list so the same items
@@ -22,6 +23,9 @@ Usage:
 Configuration:
     • `credentials.py` must define:
           fs_api_key, fs_password, fs_domain
+    • Freshservice calls go through the shared `fs_client.py` session
+      (pooling, retries, auth) at the repository root; the script adds that
+      folder to sys.path itself, so no PYTHONPATH setup is needed.
     • The custom‑field key holding the employee reference is hard‑coded as
       `untitled`; change it if your Service Catalog item uses a different key.
     • Notes are posted publicly (`private: False`). Flip the flag if you need
@@ -30,82 +34,68 @@ Configuration:
 Dependencies:
     • Python 3.9+
     • requests
-    • Standard library: argparse, base64, json, datetime
+    • Standard library: argparse, sys, concurrent.futures, json, datetime, pathlib
 
 Author: Sergio Gervacio
 Date: 2024-09-26
 ---------------------------------------------------------------------- 
 """
 
-import requests
-import credentials
-import base64
 import json
 from datetime import datetime, timezone
 import argparse
-
-def get_headers():
-    """Generate headers for the API requests."""
-    # Access the attributes of the credentials module
-    api_credentials = f"{credentials.fs_api_key}:{credentials.fs_password}"
-    encoded_credentials = base64.b64encode(api_credentials.encode()).decode()
-    return {
-        'Content-Type': 'application/json',
-        'Authorization': f"Basic {encoded_credentials}"
-    }
-
-def fetch_requested_items(ticket_id, sandbox, headers):
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from pathlib import Path
+# fs_client.py lives at the repository root, one level above this script.
+# Appended (not prepended) so credentials.py next to the script still wins.
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from fs_client import fs_get, fs_post, fs_put
+
+def fetch_requested_items(ticket_id):
     """Fetch requested items for a given ticket ID."""
-    url = f'https://{sandbox}/api/v2/tickets/{ticket_id}/requested_items'
-    response = requests.get(url, headers=headers)
+    response = fs_get(f'tickets/{ticket_id}/requested_items')
     return response.json()
 
-def fetch_assets(employee_name, sandbox, headers):
+def fetch_assets(employee_name):
     """Fetch assets for a given user name."""
-    url = f'https://{sandbox}/api/v2/assets?filter="user_id:{employee_name}"'
-    response = requests.get(url, headers=headers)
+    response = fs_get(f'assets?filter="user_id:{employee_name}"')
     return response.json()
 
-def get_asset_type(asset_type_id, sandbox, headers):
+def get_asset_type(asset_type_id):
     """Get asset type data for a given asset type ID."""
-    url = f'https://{sandbox}/api/v2/asset_types/{asset_type_id}'
-    response = requests.get(url, headers=headers)
+    response = fs_get(f'asset_types/{asset_type_id}')
     return response.json()
 
 def create_html_body(assets):
     """Convert a list of assets to a formatted HTML string."""
-    assets_html = "".join([
+    assets_html = "".join(
         f"<li>Name: {asset['name']}, Type of Asset: {asset['asset_type']['name']}, Asset Tag: {asset['asset_tag']}</li>" for asset in assets
-    ])
+    )
     return f"<p>Assets to be collected:</p><ul>{assets_html}</ul>"
 
-def add_note_to_ticket(ticket_id, sandbox, headers, html_body):
+def add_note_to_ticket(ticket_id, html_body):
     """Add a note to the ticket with the given HTML body."""
-    url = f'https://{sandbox}/api/v2/tickets/{ticket_id}/notes'
     payload = {
         'body': html_body,
         'private': False
     }
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = fs_post(f'tickets/{ticket_id}/notes', data=json.dumps(payload))
     return response.status_code, response.text
 
-def update_ticket_with_assets(ticket_id, sandbox, headers, assets):
+def update_ticket_with_assets(ticket_id, assets):
     """Update the ticket with the fetched assets."""
-    url = f'https://{sandbox}/api/v2/tickets/{ticket_id}'
     payload = {
         'assets': [
             {'display_id': asset['asset_tag']} for asset in assets
         ]
     }
-    response = requests.put(url, headers=headers, data=json.dumps(payload))
+    response = fs_put(f'tickets/{ticket_id}', data=json.dumps(payload))
     return response.status_code, response.text
 
 def main(ticket_id):
-    sandbox = credentials.fs_domain  # Access the sandbox URL from the credentials module
-    headers = get_headers()
-
     # Fetch requested items
-    requested_items = fetch_requested_items(ticket_id, sandbox, headers)
+    requested_items = fetch_requested_items(ticket_id)
 
     if 'requested_items' in requested_items and requested_items['requested_items']:
         first_item = requested_items['requested_items'][0]
@@ -115,11 +105,19 @@ def main(ticket_id):
             print(f"User Name: {employee_name}")
 
             # Fetch assets for the user
-            assets = fetch_assets(employee_name, sandbox, headers)
+            assets = fetch_assets(employee_name)
+
+            # Many assets share a type, so fetch each distinct type once, in parallel
+            distinct_type_ids = {asset.get('asset_type_id') for asset in assets.get('assets', [])}
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                type_cache = dict(zip(
+                    distinct_type_ids,
+                    executor.map(get_asset_type, distinct_type_ids)
+                ))
 
             assets_list = []
             for asset in assets.get('assets', []):
-                asset_type_data = get_asset_type(asset.get('asset_type_id'), sandbox, headers)
+                asset_type_data = type_cache[asset.get('asset_type_id')]
                 assets_list.append({
                     "name": asset.get('name'),
                     "asset_type": asset_type_data['asset_type'],
@@ -128,11 +126,11 @@ def main(ticket_id):
             # Create HTML body for note
             html_body = create_html_body(assets_list)
 
-            status_code, response_text = add_note_to_ticket(ticket_id, sandbox, headers, html_body)
+            status_code, response_text = add_note_to_ticket(ticket_id, html_body)
             print(status_code, response_text)
 
             # Update ticket with assets
-            status_code, response_text = update_ticket_with_assets(ticket_id, sandbox, headers, assets_list)
+            status_code, response_text = update_ticket_with_assets(ticket_id, assets_list)
             print(f"Ticket updated with assets: {status_code}, {response_text}")
         else:
             print("employee_name not found in custom_fields")